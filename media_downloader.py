@@ -2,13 +2,39 @@
 import asyncio
 import logging
 import os
-from typing import List, Optional, Tuple, Union
+import random
+import stat
+from collections import deque
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    FrozenSet,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 import pyrogram
 import yaml
 from pyrogram.types import Audio, Document, Photo, Video, VideoNote, Voice
 from rich.logging import RichHandler
 
+try:
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeDumper, SafeLoader  # type: ignore
+
+try:
+    import uvloop
+except ImportError:  # uvloop is optional and not available on Windows
+    uvloop = None  # type: ignore
+
 from utils.file_management import get_next_name, manage_duplicate_file
 from utils.log import LogFilter
 from utils.meta import print_meta
@@ -25,8 +51,26 @@ logging.getLogger("pyrogram.client").addFilter(LogFilter())
 logger = logging.getLogger("media_downloader")
 
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))
-FAILED_IDS: list = []
-DOWNLOADED_IDS: list = []
+FAILED_IDS: Set[int] = set()
+DOWNLOADED_IDS: Set[int] = set()
+DEFAULT_MAX_CONCURRENT: int = 8
+MAX_RETRIES: int = 3
+CHECKPOINT_INTERVAL: float = 5.0
+RETRY_BASE: float = 1.0
+RETRY_JITTER: float = 0.5
+RETRY_MAX: float = 30.0
+FILE_FORMAT_TYPES: FrozenSet[str] = frozenset(("audio", "document", "video"))
+SUPPORTED_TYPES: Tuple[str, ...] = (
+    "audio",
+    "document",
+    "photo",
+    "video",
+    "voice",
+    "video_note",
+)
+MEDIA_DIRS: Dict[str, str] = {
+    _type: os.path.join(THIS_DIR, _type) for _type in SUPPORTED_TYPES
+}
 
 
 def update_config(config: dict):
@@ -38,14 +82,37 @@ def update_config(config: dict):
     config: dict
         Configuration to be written into config file.
     """
-    config["ids_to_retry"] = (
-        list(set(config["ids_to_retry"]) - set(DOWNLOADED_IDS)) + FAILED_IDS
+    config["ids_to_retry"] = sorted(
+        (set(config["ids_to_retry"]) - DOWNLOADED_IDS) | FAILED_IDS
     )
     with open("config.yaml", "w") as yaml_file:
-        yaml.dump(config, yaml_file, default_flow_style=False)
+        yaml.dump(config, yaml_file, Dumper=SafeDumper, default_flow_style=False)
     logger.info("Updated last read message_id to config file")
 
 
+def _retry_delay(retry: int) -> float:
+    """
+    Get the delay before the next download attempt.
+
+    The delay doubles with every retry, is randomised by up to
+    ``RETRY_JITTER`` and capped at ``RETRY_MAX`` seconds.
+
+    Parameters
+    ----------
+    retry: int
+        Zero based count of the failed attempts so far.
+
+    Returns
+    -------
+    float
+        Number of seconds to wait before retrying.
+    """
+    return min(
+        RETRY_MAX,
+        RETRY_BASE * 2.0**retry * (1 + random.random() * RETRY_JITTER),
+    )
+
+
 def _can_download(_type: str, file_formats: dict, file_format: Optional[str]) -> bool:
     """
     Check if the given file format can be downloaded.
@@ -55,7 +122,7 @@ def _can_download(_type: str, file_formats: dict, file_format: Optional[str]) ->
     _type: str
         Type of media object.
     file_formats: dict
-        Dictionary containing the list of file_formats
+        Dictionary containing the set of file_formats
         to be downloaded for `audio`, `document` & `video`
         media types
     file_format: str
@@ -66,16 +133,18 @@ def _can_download(_type: str, file_formats: dict, file_format: Optional[str]) ->
     bool
         True if the file format can be downloaded else False.
     """
-    if _type in ["audio", "document", "video"]:
-        allowed_formats: list = file_formats[_type]
-        if not file_format in allowed_formats and allowed_formats[0] != "all":
+    if _type in FILE_FORMAT_TYPES:
+        allowed_formats: FrozenSet[str] = file_formats[_type]
+        if file_format not in allowed_formats and "all" not in allowed_formats:
             return False
     return True
 
 
 def _is_exist(file_path: str) -> bool:
     """
-    Check if a file exists and it is not a directory.
+    Check if a file exists and it is a regular file.
+
+    A single ``stat`` call is used for both checks.
 
     Parameters
     ----------
@@ -87,15 +156,176 @@ def _is_exist(file_path: str) -> bool:
     bool
         True if the file exists else False.
     """
-    return not os.path.isdir(file_path) and os.path.exists(file_path)
+    try:
+        return stat.S_ISREG(os.stat(file_path).st_mode)
+    except OSError:
+        return False
 
 
-async def _get_media_meta(
+def _is_downloaded(
+    file_path: str,
+    media_obj: Union[Audio, Document, Photo, Video, VideoNote, Voice],
+) -> bool:
+    """
+    Check if an existing file is a complete download of a media object.
+
+    Parameters
+    ----------
+    file_path: str
+        Absolute path of the existing file.
+    media_obj: Union[Audio, Document, Photo, Video, VideoNote, Voice]
+        Media object the file was downloaded from.
+
+    Returns
+    -------
+    bool
+        True if the file size matches the size of the media else False.
+    """
+    return os.path.getsize(file_path) == getattr(media_obj, "file_size", None)
+
+
+def _media_dir(_type: str) -> str:
+    """
+    Get the download directory of a media type.
+
+    Parameters
+    ----------
+    _type: str
+        Type of media object.
+
+    Returns
+    -------
+    str
+        Absolute path of the directory, precomputed in ``MEDIA_DIRS``
+        for the supported types.
+    """
+    media_dir: Optional[str] = MEDIA_DIRS.get(_type)
+    if media_dir is None:
+        media_dir = os.path.join(THIS_DIR, _type)
+    return media_dir
+
+
+def _named_meta(
+    media_obj: Union[Audio, Document, Video], _type: str
+) -> Tuple[str, Optional[str]]:
+    """
+    Extract file name and file format of media carrying a file name.
+
+    Used for ``audio``, ``document`` and ``video``, whose format is
+    taken from the mime type.
+
+    Parameters
+    ----------
+    media_obj: Union[Audio, Document, Video]
+        Media object to be extracted.
+    _type: str
+        Type of media object.
+
+    Returns
+    -------
+    Tuple[str, Optional[str]]
+        file_name, file_format
+    """
+    return (
+        os.path.join(_media_dir(_type), getattr(media_obj, "file_name", None) or ""),
+        media_obj.mime_type.rsplit("/", 1)[-1],  # type: ignore
+    )
+
+
+def _dated_meta(
+    media_obj: Union[VideoNote, Voice], _type: str
+) -> Tuple[str, Optional[str]]:
+    """
+    Extract file name and file format of recorded media.
+
+    Used for ``voice`` and ``video_note``, which have no file name
+    and are named after their type and date of recording.
+
+    Parameters
+    ----------
+    media_obj: Union[VideoNote, Voice]
+        Media object to be extracted.
+    _type: str
+        Type of media object.
+
+    Returns
+    -------
+    Tuple[str, Optional[str]]
+        file_name, file_format
+    """
+    file_format: str = media_obj.mime_type.rsplit("/", 1)[-1]  # type: ignore
+    file_name: str = f"{_type}_{media_obj.date.isoformat()}.{file_format}"
+    return os.path.join(_media_dir(_type), file_name), file_format
+
+
+def _photo_meta(media_obj: Photo, _type: str) -> Tuple[str, Optional[str]]:
+    """
+    Extract file name of photos.
+
+    Photos have no file name, only the download directory is
+    returned and pyrogram names the file on download.
+
+    Parameters
+    ----------
+    media_obj: Photo
+        Media object to be extracted.
+    _type: str
+        Type of media object.
+
+    Returns
+    -------
+    Tuple[str, Optional[str]]
+        file_name, file_format
+    """
+    # pylint: disable = W0613
+    return os.path.join(_media_dir(_type), ""), None
+
+
+def _default_meta(media_obj: Any, _type: str) -> Tuple[str, Optional[str]]:
+    """
+    Extract file name of media types without a dedicated handler.
+
+    Such media, e.g. ``animation`` or ``sticker``, is saved under its
+    own file name if it has one and is not filtered by file format.
+
+    Parameters
+    ----------
+    media_obj: Any
+        Media object to be extracted.
+    _type: str
+        Type of media object.
+
+    Returns
+    -------
+    Tuple[str, Optional[str]]
+        file_name, file_format
+    """
+    return (
+        os.path.join(_media_dir(_type), getattr(media_obj, "file_name", None) or ""),
+        None,
+    )
+
+
+MEDIA_META_HANDLERS: Dict[str, Callable[[Any, str], Tuple[str, Optional[str]]]] = {
+    "audio": _named_meta,
+    "document": _named_meta,
+    "photo": _photo_meta,
+    "video": _named_meta,
+    "voice": _dated_meta,
+    "video_note": _dated_meta,
+}
+
+
+def _get_media_meta(
     media_obj: Union[Audio, Document, Photo, Video, VideoNote, Voice],
     _type: str,
 ) -> Tuple[str, Optional[str]]:
     """Extract file name and file id from media object.
 
+    The extraction is dispatched to the handler of the media type
+    in ``MEDIA_META_HANDLERS``, other media types are handled by
+    ``_default_meta``.
+
     Parameters
     ----------
     media_obj: Union[Audio, Document, Photo, Video, VideoNote, Voice]
@@ -108,29 +338,43 @@ async def _get_media_meta(
     Tuple[str, Optional[str]]
         file_name, file_format
     """
-    if _type in ["audio", "document", "video"]:
-        # pylint: disable = C0301
-        file_format: Optional[str] = media_obj.mime_type.split("/")[-1]  # type: ignore
-    else:
-        file_format = None
-
-    if _type in ["voice", "video_note"]:
-        # pylint: disable = C0209
-        file_format = media_obj.mime_type.split("/")[-1]  # type: ignore
-        file_name: str = os.path.join(
-            THIS_DIR,
-            _type,
-            "{}_{}.{}".format(
-                _type,
-                media_obj.date.isoformat(),  # type: ignore
-                file_format,
-            ),
-        )
-    else:
-        file_name = os.path.join(
-            THIS_DIR, _type, getattr(media_obj, "file_name", None) or ""
-        )
-    return file_name, file_format
+    return MEDIA_META_HANDLERS.get(_type, _default_meta)(media_obj, _type)
+
+
+async def _download_copy(
+    client: pyrogram.client.Client,
+    message: pyrogram.types.Message,
+    file_name: str,
+) -> str:
+    """
+    Download media next to an existing file of the same name.
+
+    The media is saved under the next available copy name and
+    removed again if it duplicates one of the existing files.
+    Hashing the files blocks, so the duplicate check runs in the
+    default executor instead of the event loop thread.
+
+    Parameters
+    ----------
+    client: pyrogram.client.Client
+        Client to interact with Telegram APIs.
+    message: pyrogram.types.Message
+        Message object retrieved from telegram.
+    file_name: str
+        Absolute path of the existing file.
+
+    Returns
+    -------
+    str
+        Absolute path of the downloaded or duplicate file.
+    """
+    download_path = await client.download_media(
+        message, file_name=get_next_name(file_name)
+    )
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, manage_duplicate_file, download_path  # type: ignore
+    )
 
 
 async def download_media(
@@ -138,12 +382,14 @@ async def download_media(
     message: pyrogram.types.Message,
     media_types: List[str],
     file_formats: dict,
+    skip_if_exists: bool = False,
 ):
     """
     Download media from Telegram.
 
-    Each of the files to download are retried 3 times with a
-    delay of 5 seconds each.
+    Each of the files to download is retried ``MAX_RETRIES`` times,
+    backing off exponentially between the attempts. Flood waits
+    requested by Telegram are honoured as is.
 
     Parameters
     ----------
@@ -164,13 +410,17 @@ async def download_media(
         Dictionary containing the list of file_formats
         to be downloaded for `audio`, `document` & `video`
         media types.
+    skip_if_exists: bool
+        Skip the download if a file of the same name and size
+        already exists instead of downloading a copy.
 
     Returns
     -------
     int
         Current message id.
     """
-    for retry in range(3):
+    # pylint: disable = R0912, R0915, W0706
+    for retry in range(MAX_RETRIES):
         try:
             if message.media is None:
                 return message.id
@@ -178,23 +428,39 @@ async def download_media(
                 _media = getattr(message, _type, None)
                 if _media is None:
                     continue
-                file_name, file_format = await _get_media_meta(_media, _type)
-                if _can_download(_type, file_formats, file_format):
-                    if _is_exist(file_name):
-                        file_name = get_next_name(file_name)
-                        download_path = await client.download_media(
-                            message, file_name=file_name
-                        )
-                        # pylint: disable = C0301
-                        download_path = manage_duplicate_file(download_path)  # type: ignore
-                    else:
-                        download_path = await client.download_media(
-                            message, file_name=file_name
-                        )
-                    if download_path:
-                        logger.info("Media downloaded - %s", download_path)
-                    DOWNLOADED_IDS.append(message.id)
+                file_name, file_format = _get_media_meta(_media, _type)
+                if not _can_download(_type, file_formats, file_format):
+                    continue
+                if _is_exist(file_name):
+                    if skip_if_exists and _is_downloaded(file_name, _media):
+                        logger.info("Media already downloaded - %s", file_name)
+                        DOWNLOADED_IDS.add(message.id)
+                        continue
+                    download_path = await _download_copy(client, message, file_name)
+                else:
+                    download_path = await client.download_media(  # type: ignore
+                        message, file_name=file_name
+                    )
+                if download_path:
+                    logger.info("Media downloaded - %s", download_path)
+                DOWNLOADED_IDS.add(message.id)
             break
+        except pyrogram.errors.FloodWait as e:
+            if retry == MAX_RETRIES - 1:
+                # pylint: disable = C0301
+                logger.error(
+                    "Message[%d]: flood wait persisted for %d retries, download skipped.",
+                    message.id,
+                    MAX_RETRIES,
+                )
+                FAILED_IDS.add(message.id)
+                break
+            logger.warning(
+                "Message[%d]: flood wait requested by Telegram, retrying after %d seconds",
+                message.id,
+                e.value,
+            )
+            await asyncio.sleep(e.value)  # type: ignore
         except pyrogram.errors.exceptions.bad_request_400.BadRequest:
             logger.warning(
                 "Message[%d]: file reference expired, refetching...",
@@ -204,26 +470,36 @@ async def download_media(
                 chat_id=message.chat.id,  # type: ignore
                 message_ids=message.id,
             )
-            if retry == 2:
+            if retry == MAX_RETRIES - 1:
                 # pylint: disable = C0301
                 logger.error(
-                    "Message[%d]: file reference expired for 3 retries, download skipped.",
+                    "Message[%d]: file reference expired for %d retries, download skipped.",
                     message.id,
+                    MAX_RETRIES,
                 )
-                FAILED_IDS.append(message.id)
-        except TypeError:
+                FAILED_IDS.add(message.id)
+                break
+            await asyncio.sleep(_retry_delay(retry))
+        except (TypeError, asyncio.TimeoutError):
+            if retry == MAX_RETRIES - 1:
+                logger.error(
+                    "Message[%d]: Timing out after %d retries, download skipped.",
+                    message.id,
+                    MAX_RETRIES,
+                )
+                FAILED_IDS.add(message.id)
+                break
+            delay: float = _retry_delay(retry)
             # pylint: disable = C0301
             logger.warning(
-                "Timeout Error occurred when downloading Message[%d], retrying after 5 seconds",
+                "Timeout Error occurred when downloading Message[%d], retrying after %.1f seconds",
                 message.id,
+                delay,
             )
-            await asyncio.sleep(5)
-            if retry == 2:
-                logger.error(
-                    "Message[%d]: Timing out after 3 reties, download skipped.",
-                    message.id,
-                )
-                FAILED_IDS.append(message.id)
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            # Subclasses `Exception` on Python 3.7, don't log it as failed.
+            raise
         except Exception as e:
             # pylint: disable = C0301
             logger.error(
@@ -232,145 +508,299 @@ async def download_media(
                 e,
                 exc_info=True,
             )
-            FAILED_IDS.append(message.id)
+            FAILED_IDS.add(message.id)
             break
     return message.id
 
 
-async def process_messages(
-    client: pyrogram.client.Client,
-    messages: List[pyrogram.types.Message],
-    media_types: List[str],
-    file_formats: dict,
-) -> int:
+def _advance_checkpoint(config: dict, pending: Deque[int], done: Set[int]):
     """
-    Download media from Telegram.
+    Move ``last_read_message_id`` past every finished message.
+
+    Messages are read in order but finish downloading in any order,
+    so the checkpoint only advances over the leading run of pending
+    message ids which are already done.
 
     Parameters
     ----------
-    client: pyrogram.client.Client
-        Client to interact with Telegram APIs.
-    messages: list
-        List of telegram messages.
+    config: dict
+        Configuration holding the ``last_read_message_id``.
+    pending: Deque[int]
+        Ids of the messages read from the chat history, in order.
+    done: Set[int]
+        Ids of the messages which finished downloading.
+    """
+    while pending and pending[0] in done:
+        message_id: int = pending.popleft()
+        done.discard(message_id)
+        config["last_read_message_id"] = message_id
+
+
+def _has_media(message: pyrogram.types.Message, media_types: List[str]) -> bool:
+    """
+    Check if a message carries any of the requested media types.
+
+    Parameters
+    ----------
+    message: pyrogram.types.Message
+        Message object retrieved from telegram.
     media_types: list
         List of strings of media types to be downloaded.
-        Ex : `["audio", "photo"]`
-        Supported formats:
-            * audio
-            * document
-            * photo
-            * video
-            * voice
+
+    Returns
+    -------
+    bool
+        True if the message has media to be downloaded else False.
+    """
+    if message.media is None:
+        return False
+    return any(getattr(message, _type, None) is not None for _type in media_types)
+
+
+@dataclass
+class _ImportRun:
+    """
+    State shared by the tasks of a single import run.
+
+    Attributes
+    ----------
+    client: pyrogram.client.Client
+        Client to interact with Telegram APIs.
+    config: dict
+        Configuration of the current run.
     file_formats: dict
-        Dictionary containing the list of file_formats
+        Dictionary containing the frozenset of file_formats
         to be downloaded for `audio`, `document` & `video`
         media types.
+    queue: asyncio.Queue
+        Queue of messages to be downloaded.
+    pending: Deque[int]
+        Ids of the chat history messages read so far, in order.
+    done: Set[int]
+        Ids of the messages which finished downloading.
+    progress: asyncio.Event
+        Event set whenever a message is marked as done.
+    """
+
+    client: pyrogram.client.Client
+    config: dict
+    file_formats: dict
+    queue: asyncio.Queue
+    pending: Deque[int] = field(default_factory=deque)
+    done: Set[int] = field(default_factory=set)
+    progress: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+async def _produce(run: _ImportRun):
+    """
+    Feed the messages to be downloaded into the work queue.
+
+    Messages failed during the last run are queued first, followed
+    by the chat history starting after ``last_read_message_id``.
+    Messages without any of the requested media types are not
+    queued, they are marked as done straight away.
+
+    Parameters
+    ----------
+    run: _ImportRun
+        State of the current import run.
+    """
+    config: dict = run.config
+    media_types: List[str] = config["media_types"]
+    if config["ids_to_retry"]:
+        logger.info("Downloading files failed during last run...")
+        skipped_messages: list = await run.client.get_messages(  # type: ignore
+            chat_id=config["chat_id"], message_ids=config["ids_to_retry"]
+        )
+        for message in skipped_messages:
+            if _has_media(message, media_types):
+                await run.queue.put(message)
+
+    messages_iter = run.client.get_chat_history(
+        config["chat_id"], offset_id=config["last_read_message_id"], reverse=True
+    )
+    async for message in messages_iter:  # type: ignore
+        run.pending.append(message.id)
+        if _has_media(message, media_types):
+            await run.queue.put(message)
+        else:
+            run.done.add(message.id)
+            run.progress.set()
+
+
+async def _worker(run: _ImportRun):
+    """
+    Download the media of queued messages until cancelled.
+
+    Errors escaping ``download_media`` are logged and the message
+    is marked as failed, so that the worker keeps running.
+
+    Parameters
+    ----------
+    run: _ImportRun
+        State of the current import run.
+    """
+    media_types: List[str] = run.config["media_types"]
+    skip_if_exists: bool = run.config.get("skip_if_exists", False)
+    while True:
+        message: pyrogram.types.Message = await run.queue.get()
+        try:
+            await download_media(
+                run.client, message, media_types, run.file_formats, skip_if_exists
+            )
+        except asyncio.CancelledError:
+            run.queue.task_done()
+            raise
+        except Exception as e:
+            # A dead worker would leave `queue.join()` waiting forever.
+            # pylint: disable = C0301
+            logger.error(
+                "Message[%d]: could not be downloaded due to following exception:\n[%s].",
+                message.id,
+                e,
+                exc_info=True,
+            )
+            FAILED_IDS.add(message.id)
+        run.done.add(message.id)
+        run.progress.set()
+        run.queue.task_done()
+
+
+async def _checkpoint(run: _ImportRun, interval: float):
+    """
+    Persist the download progress until cancelled.
+
+    The config file is written whenever ``progress`` is set, but at
+    most once every ``interval`` seconds, so a burst of finished
+    downloads results in a single write.
+
+    Parameters
+    ----------
+    run: _ImportRun
+        State of the current import run.
+    interval: float
+        Minimum number of seconds between two writes of the config file.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        await run.progress.wait()
+        run.progress.clear()
+        _advance_checkpoint(run.config, run.pending, run.done)
+        # Writing the file blocks, keep it off the event loop thread.
+        write = loop.run_in_executor(None, update_config, run.config)
+        try:
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            # Let an ongoing write finish before the final one in `main`.
+            await write
+            raise
+        await asyncio.sleep(interval)
+
+
+async def begin_import(
+    client: pyrogram.client.Client, config: dict, pagination_limit: int
+) -> dict:
+    """
+    Initiate download using an already started pyrogram client.
+
+    Iter through message offset on the ``last_message_id`` and
+    the requested file_formats.
+
+    The download directories of the requested media types are
+    created upfront. Messages are streamed into a bounded queue while
+    ``max_concurrent`` (from the config, default ``8``) workers
+    download their media, so reading the chat history overlaps
+    with the downloads.
+
+    Parameters
+    ----------
+    client: pyrogram.client.Client
+        Started client to interact with Telegram APIs.
+    config: dict
+        Dict containing the config of the chat to download.
+    pagination_limit: int
+        Maximum number of messages read ahead of the downloads.
 
     Returns
     -------
-    int
-        Max value of list of message ids.
+    dict
+        Updated configuration to be written into config file.
     """
-    message_ids = await asyncio.gather(
-        *[
-            download_media(client, message, media_types, file_formats)
-            for message in messages
-        ]
+    for _type in config["media_types"]:
+        os.makedirs(_media_dir(_type), exist_ok=True)
+    run = _ImportRun(
+        client=client,
+        config=config,
+        file_formats={
+            _type: frozenset(formats)
+            for _type, formats in config["file_formats"].items()
+        },
+        queue=asyncio.Queue(maxsize=pagination_limit),
     )
-
-    last_message_id: int = max(message_ids)
-    return last_message_id
+    workers: List[asyncio.Task] = [
+        asyncio.create_task(_worker(run))
+        for _ in range(config.get("max_concurrent", DEFAULT_MAX_CONCURRENT))
+    ]
+    checkpointer = asyncio.create_task(_checkpoint(run, CHECKPOINT_INTERVAL))
+    try:
+        await _produce(run)
+        await run.queue.join()
+    finally:
+        for task in workers + [checkpointer]:
+            task.cancel()
+        await asyncio.gather(*workers, checkpointer, return_exceptions=True)
+
+    _advance_checkpoint(config, run.pending, run.done)
+    return config
 
 
-async def begin_import(config: dict, pagination_limit: int) -> dict:
+async def run_import(config: dict, pagination_limit: int) -> dict:
     """
-    Create pyrogram client and initiate download.
+    Create pyrogram client and run the download with it.
 
     The pyrogram client is created using the ``api_id``, ``api_hash``
-    from the config and iter through message offset on the
-    ``last_message_id`` and the requested file_formats.
+    and optional ``proxy`` from the config. It is started once and
+    stopped when the download finishes.
 
     Parameters
     ----------
     config: dict
         Dict containing the config to create pyrogram client.
     pagination_limit: int
-        Number of message to download asynchronously as a batch.
+        Maximum number of messages read ahead of the downloads.
 
     Returns
     -------
     dict
         Updated configuration to be written into config file.
     """
-    client = pyrogram.Client(
+    async with pyrogram.Client(
         "media_downloader",
         api_id=config["api_id"],
         api_hash=config["api_hash"],
         proxy=config.get("proxy"),
-    )
-    await client.start()
-    last_read_message_id: int = config["last_read_message_id"]
-    messages_iter = client.get_chat_history(
-        config["chat_id"], offset_id=last_read_message_id, reverse=True
-    )
-    messages_list: list = []
-    pagination_count: int = 0
-    if config["ids_to_retry"]:
-        logger.info("Downloading files failed during last run...")
-        skipped_messages: list = await client.get_messages(  # type: ignore
-            chat_id=config["chat_id"], message_ids=config["ids_to_retry"]
-        )
-        for message in skipped_messages:
-            pagination_count += 1
-            messages_list.append(message)
-
-    async for message in messages_iter:  # type: ignore
-        if pagination_count != pagination_limit:
-            pagination_count += 1
-            messages_list.append(message)
-        else:
-            last_read_message_id = await process_messages(
-                client,
-                messages_list,
-                config["media_types"],
-                config["file_formats"],
-            )
-            pagination_count = 0
-            messages_list = []
-            messages_list.append(message)
-            config["last_read_message_id"] = last_read_message_id
-            update_config(config)
-    if messages_list:
-        last_read_message_id = await process_messages(
-            client,
-            messages_list,
-            config["media_types"],
-            config["file_formats"],
-        )
-
-    await client.stop()
-    config["last_read_message_id"] = last_read_message_id
-    return config
+    ) as client:
+        return await begin_import(client, config, pagination_limit)
 
 
 def main():
     """Main function of the downloader."""
     with open(os.path.join(THIS_DIR, "config.yaml")) as f:
-        config = yaml.safe_load(f)
-    updated_config = asyncio.get_event_loop().run_until_complete(
-        begin_import(config, pagination_limit=100)
-    )
+        config = yaml.load(f, Loader=SafeLoader)
+    updated_config = asyncio.run(run_import(config, pagination_limit=100))
     if FAILED_IDS:
         logger.info(
             "Downloading of %d files failed. "
             "Failed message ids are added to config file.\n"
             "These files will be downloaded on the next run.",
-            len(set(FAILED_IDS)),
+            len(FAILED_IDS),
         )
     update_config(updated_config)
-    check_for_updates()
 
 
 if __name__ == "__main__":
+    if uvloop is not None:
+        uvloop.install()
     print_meta(logger)
     main()
+    check_for_updates()
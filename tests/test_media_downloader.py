@@ -4,25 +4,35 @@ import copy
 import os
 import platform
 import unittest
+from collections import deque
 from datetime import datetime
 
 import mock
 import pyrogram
 
 from media_downloader import (
+    SUPPORTED_TYPES,
+    SafeDumper,
+    _advance_checkpoint,
     _can_download,
+    _checkpoint,
     _get_media_meta,
+    _has_media,
+    _ImportRun,
     _is_exist,
+    _media_dir,
+    _retry_delay,
     begin_import,
     download_media,
     main,
-    process_messages,
+    run_import,
     update_config,
 )
 
 MOCK_DIR: str = "/root/project"
 if platform.system() == "Windows":
     MOCK_DIR = "\\root\\project"
+MOCK_MEDIA_DIRS = {_type: os.path.join(MOCK_DIR, _type) for _type in SUPPORTED_TYPES}
 MOCK_CONF = {
     "api_id": 123,
     "api_hash": "hasw5Tgawsuj67",
@@ -67,6 +77,7 @@ class MockAudio:
     def __init__(self, **kwargs):
         self.file_name = kwargs["file_name"]
         self.mime_type = kwargs["mime_type"]
+        self.file_size = kwargs.get("file_size")
 
 
 class MockDocument:
@@ -91,64 +102,59 @@ class MockVideo:
         self.mime_type = kwargs["mime_type"]
 
 
-class MockVideoNote:
+class MockAnimation:
     def __init__(self, **kwargs):
+        self.file_name = kwargs["file_name"]
         self.mime_type = kwargs["mime_type"]
-        self.date = kwargs["date"]
 
 
-class MockEventLoop:
-    def __init__(self):
-        pass
-
-    def run_until_complete(self, *args, **kwargs):
-        return {"api_id": 1, "api_hash": "asdf", "ids_to_retry": [1, 2, 3]}
+class MockVideoNote:
+    def __init__(self, **kwargs):
+        self.mime_type = kwargs["mime_type"]
+        self.date = kwargs["date"]
 
 
 class MockAsync:
     def __init__(self):
         pass
 
-    def get_event_loop(self):
-        return MockEventLoop()
-
-
-async def async_get_media_meta(message_media, _type):
-    result = await _get_media_meta(message_media, _type)
-    return result
-
-
-async def async_download_media(client, message, media_types, file_formats):
-    result = await download_media(client, message, media_types, file_formats)
-    return result
+    def run(self, *args, **kwargs):
+        return {"api_id": 1, "api_hash": "asdf", "ids_to_retry": [1, 2, 3]}
 
 
-async def async_begin_import(conf, pagination_limit):
-    result = await begin_import(conf, pagination_limit)
+async def async_download_media(
+    client, message, media_types, file_formats, skip_if_exists=False
+):
+    result = await download_media(
+        client, message, media_types, file_formats, skip_if_exists
+    )
     return result
 
 
-async def mock_process_message(*args, **kwargs):
-    return 5
-
-
-async def async_process_messages(client, messages, media_types, file_formats):
-    result = await process_messages(client, messages, media_types, file_formats)
+async def async_begin_import(client, conf, pagination_limit):
+    result = await begin_import(client, conf, pagination_limit)
     return result
 
 
 class MockClient:
     def __init__(self, *args, **kwargs):
-        pass
+        self.started = False
 
     def __aiter__(self):
         return self
 
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
     async def start(self):
-        pass
+        self.started = True
 
     async def stop(self):
-        pass
+        self.started = False
 
     async def get_chat_history(self, *args, **kwargs):
         items = [
@@ -222,15 +228,61 @@ class MockClient:
             raise pyrogram.errors.exceptions.unauthorized_401.Unauthorized
         elif mock_message.id == 11:
             raise TypeError
+        elif mock_message.id == 12:
+            raise pyrogram.errors.FloodWait(value=5)
+        return kwargs["file_name"]
+
+
+class MockConcurrencyClient(MockClient):
+    active = 0
+    max_active = 0
+
+    async def get_chat_history(self, *args, **kwargs):
+        for i in range(10):
+            yield MockMessage(
+                id=i,
+                media=True,
+                voice=MockVoice(
+                    mime_type="audio/ogg",
+                    date=datetime(2019, 7, 25, 14, 53, i),
+                ),
+            )
+
+    async def download_media(self, *args, **kwargs):
+        MockConcurrencyClient.active += 1
+        MockConcurrencyClient.max_active = max(
+            MockConcurrencyClient.max_active, MockConcurrencyClient.active
+        )
+        await asyncio.sleep(0)
+        MockConcurrencyClient.active -= 1
         return kwargs["file_name"]
 
 
+class MockBrokenClient(MockConcurrencyClient):
+    async def download_media(self, *args, **kwargs):
+        raise pyrogram.errors.exceptions.bad_request_400.BadRequest
+
+    async def get_messages(self, *args, **kwargs):
+        raise RuntimeError("Connection lost")
+
+
 class MediaDownloaderTestCase(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         cls.loop = asyncio.get_event_loop()
 
     @mock.patch("media_downloader.THIS_DIR", new=MOCK_DIR)
+    @mock.patch("media_downloader.MEDIA_DIRS", new=MOCK_MEDIA_DIRS)
+    def test_media_dir(self):
+        self.assertEqual(
+            _media_dir("audio"), platform_generic_path("/root/project/audio")
+        )
+        # Types outside SUPPORTED_TYPES fall back to THIS_DIR
+        self.assertEqual(
+            _media_dir("animation"), platform_generic_path("/root/project/animation")
+        )
+
+    @mock.patch("media_downloader.MEDIA_DIRS", new=MOCK_MEDIA_DIRS)
     def test_get_media_meta(self):
         # Test Voice notes
         message = MockMessage(
@@ -241,9 +293,7 @@ class MediaDownloaderTestCase(unittest.TestCase):
                 date=datetime(2019, 7, 25, 14, 53, 50),
             ),
         )
-        result = self.loop.run_until_complete(
-            async_get_media_meta(message.voice, "voice")
-        )
+        result = _get_media_meta(message.voice, "voice")
 
         self.assertEqual(
             (
@@ -261,9 +311,7 @@ class MediaDownloaderTestCase(unittest.TestCase):
             media=True,
             photo=MockPhoto(date=datetime(2019, 8, 5, 14, 35, 12)),
         )
-        result = self.loop.run_until_complete(
-            async_get_media_meta(message.photo, "photo")
-        )
+        result = _get_media_meta(message.photo, "photo")
         self.assertEqual(
             (
                 platform_generic_path("/root/project/photo/"),
@@ -281,9 +329,7 @@ class MediaDownloaderTestCase(unittest.TestCase):
                 mime_type="application/pdf",
             ),
         )
-        result = self.loop.run_until_complete(
-            async_get_media_meta(message.document, "document")
-        )
+        result = _get_media_meta(message.document, "document")
         self.assertEqual(
             (
                 platform_generic_path("/root/project/document/sample_document.pdf"),
@@ -301,9 +347,7 @@ class MediaDownloaderTestCase(unittest.TestCase):
                 mime_type="audio/mp3",
             ),
         )
-        result = self.loop.run_until_complete(
-            async_get_media_meta(message.audio, "audio")
-        )
+        result = _get_media_meta(message.audio, "audio")
         self.assertEqual(
             (
                 platform_generic_path("/root/project/audio/sample_audio.mp3"),
@@ -320,9 +364,7 @@ class MediaDownloaderTestCase(unittest.TestCase):
                 mime_type="video/mp4",
             ),
         )
-        result = self.loop.run_until_complete(
-            async_get_media_meta(message.video, "video")
-        )
+        result = _get_media_meta(message.video, "video")
         self.assertEqual(
             (
                 platform_generic_path("/root/project/video/"),
@@ -340,9 +382,7 @@ class MediaDownloaderTestCase(unittest.TestCase):
                 date=datetime(2019, 7, 25, 14, 53, 50),
             ),
         )
-        result = self.loop.run_until_complete(
-            async_get_media_meta(message.video_note, "video_note")
-        )
+        result = _get_media_meta(message.video_note, "video_note")
         self.assertEqual(
             (
                 platform_generic_path(
@@ -353,7 +393,23 @@ class MediaDownloaderTestCase(unittest.TestCase):
             result,
         )
 
-    @mock.patch("media_downloader.THIS_DIR", new=MOCK_DIR)
+        # Test media types without a dedicated handler
+        message = MockMessage(id=7, media=True)
+        message.animation = MockAnimation(
+            file_name="sample_animation.mp4",
+            mime_type="video/mp4",
+        )
+        with mock.patch("media_downloader.THIS_DIR", new=MOCK_DIR):
+            result = _get_media_meta(message.animation, "animation")
+        self.assertEqual(
+            (
+                platform_generic_path("/root/project/animation/sample_animation.mp4"),
+                None,
+            ),
+            result,
+        )
+
+    @mock.patch("media_downloader.MEDIA_DIRS", new=MOCK_MEDIA_DIRS)
     @mock.patch("media_downloader.asyncio.sleep", return_value=None)
     @mock.patch("media_downloader.logger")
     def test_download_media(self, mock_logger, patched_time_sleep):
@@ -423,8 +479,9 @@ class MediaDownloaderTestCase(unittest.TestCase):
         )
         self.assertEqual(8, result)
         mock_logger.error.assert_called_with(
-            "Message[%d]: file reference expired for 3 retries, download skipped.",
+            "Message[%d]: file reference expired for %d retries, download skipped.",
             8,
+            3,
         )
 
         # Test other exception
@@ -477,8 +534,102 @@ class MediaDownloaderTestCase(unittest.TestCase):
         )
         self.assertEqual(11, result)
         mock_logger.error.assert_called_with(
-            "Message[%d]: Timing out after 3 reties, download skipped.", 11
+            "Message[%d]: Timing out after %d retries, download skipped.", 11, 3
+        )
+
+        # Test flood wait
+        patched_time_sleep.reset_mock()
+        message_7 = MockMessage(
+            id=12,
+            media=True,
+            video=MockVideo(
+                file_name="sample_video.mov",
+                mime_type="video/mov",
+            ),
+        )
+        result = self.loop.run_until_complete(
+            async_download_media(
+                client, message_7, ["video", "photo"], {"video": ["all"]}
+            )
+        )
+        self.assertEqual(12, result)
+        patched_time_sleep.assert_has_calls([mock.call(5), mock.call(5)])
+        mock_logger.error.assert_called_with(
+            "Message[%d]: flood wait persisted for %d retries, download skipped.",
+            12,
+            3,
+        )
+
+    @mock.patch("media_downloader.FAILED_IDS", new_callable=set)
+    @mock.patch("media_downloader.MEDIA_DIRS", new=MOCK_MEDIA_DIRS)
+    def test_download_media_cancelled(self, mock_failed_ids):
+        client = MockClient()
+        message = MockMessage(
+            id=14,
+            media=True,
+            video=MockVideo(
+                file_name="sample_video.mp4",
+                mime_type="video/mp4",
+            ),
+        )
+        with mock.patch.object(
+            client, "download_media", side_effect=asyncio.CancelledError
+        ):
+            with self.assertRaises(asyncio.CancelledError):
+                self.loop.run_until_complete(
+                    async_download_media(client, message, ["video"], {"video": ["all"]})
+                )
+        self.assertEqual(mock_failed_ids, set())
+
+    @mock.patch("media_downloader.random.random", return_value=1.0)
+    def test_retry_delay(self, mock_random):
+        self.assertEqual(_retry_delay(0), 1.5)
+        self.assertEqual(_retry_delay(1), 3.0)
+        self.assertEqual(_retry_delay(2), 6.0)
+        self.assertEqual(_retry_delay(10), 30.0)
+
+    @mock.patch("media_downloader.MEDIA_DIRS", new=MOCK_MEDIA_DIRS)
+    @mock.patch(
+        "media_downloader.manage_duplicate_file",
+        new=mock_manage_duplicate_file,
+    )
+    @mock.patch("media_downloader.os.path.getsize", return_value=1024)
+    @mock.patch("media_downloader._is_exist", return_value=True)
+    def test_download_media_skip_if_exists(self, mock_is_exist, mock_getsize):
+        client = MockClient()
+        message = MockMessage(
+            id=13,
+            media=True,
+            audio=MockAudio(
+                file_name="sample_audio.mp3",
+                mime_type="audio/mp3",
+                file_size=1024,
+            ),
         )
+        with mock.patch.object(
+            client, "download_media", return_value="sample_audio-copy1.mp3"
+        ) as mock_download:
+            result = self.loop.run_until_complete(
+                async_download_media(
+                    client, message, ["audio"], {"audio": ["all"]}, True
+                )
+            )
+            self.assertEqual(13, result)
+            mock_download.assert_not_called()
+
+            # Size mismatch downloads a copy
+            message.audio.file_size = 2048
+            self.loop.run_until_complete(
+                async_download_media(
+                    client, message, ["audio"], {"audio": ["all"]}, True
+                )
+            )
+            mock_download.assert_called_once_with(
+                message,
+                file_name=platform_generic_path(
+                    "/root/project/audio/sample_audio-copy1.mp3"
+                ),
+            )
 
     @mock.patch("__main__.__builtins__.open", new_callable=mock.mock_open)
     @mock.patch("media_downloader.yaml", autospec=True)
@@ -490,93 +641,160 @@ class MediaDownloaderTestCase(unittest.TestCase):
         }
         update_config(conf)
         mock_open.assert_called_with("config.yaml", "w")
-        mock_yaml.dump.assert_called_with(conf, mock.ANY, default_flow_style=False)
+        mock_yaml.dump.assert_called_with(
+            conf, mock.ANY, Dumper=SafeDumper, default_flow_style=False
+        )
+
+    @mock.patch("media_downloader.DOWNLOADED_IDS", {1, 3})
+    @mock.patch("media_downloader.FAILED_IDS", {3, 5})
+    @mock.patch("__main__.__builtins__.open", new_callable=mock.mock_open)
+    @mock.patch("media_downloader.yaml", autospec=True)
+    def test_update_config_ids_to_retry(self, mock_yaml, mock_open):
+        conf = {"ids_to_retry": [1, 2, 4]}
+        update_config(conf)
+        self.assertEqual(conf["ids_to_retry"], [2, 3, 4, 5])
 
+    @mock.patch("media_downloader.MEDIA_DIRS", new=MOCK_MEDIA_DIRS)
+    @mock.patch("media_downloader.os.makedirs")
     @mock.patch("media_downloader.update_config")
-    @mock.patch("media_downloader.pyrogram.Client", new=MockClient)
-    @mock.patch("media_downloader.process_messages", new=mock_process_message)
-    def test_begin_import(self, mock_update_config):
-        result = self.loop.run_until_complete(async_begin_import(MOCK_CONF, 3))
+    def test_begin_import(self, mock_update_config, mock_makedirs):
+        result = self.loop.run_until_complete(
+            async_begin_import(MockClient(), copy.deepcopy(MOCK_CONF), 3)
+        )
         conf = copy.deepcopy(MOCK_CONF)
-        conf["last_read_message_id"] = 5
+        conf["last_read_message_id"] = 1216
         self.assertDictEqual(result, conf)
-
-    def test_process_message(self):
-        client = MockClient()
-        result = self.loop.run_until_complete(
-            async_process_messages(
-                client,
-                [
-                    MockMessage(
-                        id=1213,
-                        media=True,
-                        voice=MockVoice(
-                            mime_type="audio/ogg",
-                            date=datetime(2019, 7, 25, 14, 53, 50),
-                        ),
-                    ),
-                    MockMessage(
-                        id=1214,
-                        media=False,
-                        text="test message 1",
-                    ),
-                    MockMessage(
-                        id=1215,
-                        media=False,
-                        text="test message 2",
-                    ),
-                    MockMessage(
-                        id=1216,
-                        media=False,
-                        text="test message 3",
-                    ),
-                ],
-                ["voice", "photo"],
-                {"audio": ["all"], "voice": ["all"]},
-            )
+        mock_makedirs.assert_has_calls(
+            [
+                mock.call(platform_generic_path("/root/project/audio"), exist_ok=True),
+                mock.call(platform_generic_path("/root/project/voice"), exist_ok=True),
+            ]
         )
-        self.assertEqual(result, 1216)
 
     @mock.patch("media_downloader._is_exist", return_value=True)
     @mock.patch(
         "media_downloader.manage_duplicate_file",
         new=mock_manage_duplicate_file,
     )
-    def test_process_message_when_file_exists(self, mock_is_exist):
-        client = MockClient()
+    @mock.patch("media_downloader.MEDIA_DIRS", new=MOCK_MEDIA_DIRS)
+    @mock.patch("media_downloader.os.makedirs")
+    @mock.patch("media_downloader.update_config")
+    def test_begin_import_when_file_exists(
+        self, mock_update_config, mock_makedirs, mock_is_exist
+    ):
         result = self.loop.run_until_complete(
-            async_process_messages(
-                client,
-                [
-                    MockMessage(
-                        id=1213,
-                        media=True,
-                        voice=MockVoice(
-                            mime_type="audio/ogg",
-                            date=datetime(2019, 7, 25, 14, 53, 50),
-                        ),
-                    ),
-                    MockMessage(
-                        id=1214,
-                        media=False,
-                        text="test message 1",
-                    ),
-                    MockMessage(
-                        id=1215,
-                        media=False,
-                        text="test message 2",
-                    ),
-                    MockMessage(
-                        id=1216,
-                        media=False,
-                        text="test message 3",
-                    ),
-                ],
-                ["voice", "photo"],
-                {"audio": ["all"], "voice": ["all"]},
+            async_begin_import(MockClient(), copy.deepcopy(MOCK_CONF), 3)
+        )
+        self.assertEqual(result["last_read_message_id"], 1216)
+
+    @mock.patch("media_downloader.MEDIA_DIRS", new=MOCK_MEDIA_DIRS)
+    @mock.patch("media_downloader.os.makedirs")
+    @mock.patch("media_downloader.update_config")
+    def test_begin_import_bounded_concurrency(self, mock_update_config, mock_makedirs):
+        conf = copy.deepcopy(MOCK_CONF)
+        conf["ids_to_retry"] = []
+        conf["max_concurrent"] = 3
+        result = self.loop.run_until_complete(
+            async_begin_import(MockConcurrencyClient(), conf, 5)
+        )
+        self.assertEqual(result["last_read_message_id"], 9)
+        self.assertEqual(MockConcurrencyClient.max_active, 3)
+
+    @mock.patch("media_downloader.FAILED_IDS", new_callable=set)
+    @mock.patch("media_downloader.logger")
+    @mock.patch("media_downloader.MEDIA_DIRS", new=MOCK_MEDIA_DIRS)
+    @mock.patch("media_downloader.os.makedirs")
+    @mock.patch("media_downloader.update_config")
+    def test_begin_import_worker_error(
+        self, mock_update_config, mock_makedirs, mock_logger, mock_failed_ids
+    ):
+        conf = copy.deepcopy(MOCK_CONF)
+        conf["ids_to_retry"] = []
+        conf["max_concurrent"] = 2
+        result = self.loop.run_until_complete(
+            asyncio.wait_for(async_begin_import(MockBrokenClient(), conf, 5), 5)
+        )
+        self.assertEqual(result["last_read_message_id"], 9)
+        self.assertEqual(mock_failed_ids, set(range(10)))
+        mock_logger.error.assert_called_with(
+            "Message[%d]: could not be downloaded due to following exception:\n[%s].",
+            9,
+            mock.ANY,
+            exc_info=True,
+        )
+
+    @mock.patch("media_downloader.pyrogram.Client", new=MockClient)
+    @mock.patch("media_downloader.begin_import")
+    def test_run_import(self, mock_import):
+        async def mock_begin_import(client, conf, pagination_limit):
+            self.assertTrue(client.started)
+            return conf
+
+        mock_import.side_effect = mock_begin_import
+        conf = copy.deepcopy(MOCK_CONF)
+        result = self.loop.run_until_complete(run_import(conf, 3))
+        self.assertDictEqual(result, conf)
+        mock_import.assert_called_once_with(mock.ANY, conf, 3)
+        self.assertFalse(mock_import.call_args[0][0].started)
+
+    def test_advance_checkpoint(self):
+        conf = {"last_read_message_id": 0}
+        pending = deque([1, 2, 3, 4])
+        done = {2, 3}
+        _advance_checkpoint(conf, pending, done)
+        self.assertEqual(conf["last_read_message_id"], 0)
+
+        done.add(1)
+        _advance_checkpoint(conf, pending, done)
+        self.assertEqual(conf["last_read_message_id"], 3)
+        self.assertEqual(list(pending), [4])
+        self.assertEqual(done, set())
+
+    @mock.patch("media_downloader.update_config")
+    def test_checkpoint(self, mock_update_config):
+        conf = {"last_read_message_id": 0}
+
+        async def run_checkpoint():
+            run = _ImportRun(
+                client=MockClient(),
+                config=conf,
+                file_formats={},
+                queue=asyncio.Queue(),
+                pending=deque([1, 2]),
+                done={1},
             )
+            progress = run.progress
+            task = asyncio.ensure_future(_checkpoint(run, 10))
+            await asyncio.sleep(0.05)
+            # Nothing is written until some progress is made
+            mock_update_config.assert_not_called()
+
+            progress.set()
+            await asyncio.sleep(0.05)
+            # Further progress within the interval is debounced
+            progress.set()
+            await asyncio.sleep(0.05)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        self.loop.run_until_complete(run_checkpoint())
+        self.assertEqual(conf["last_read_message_id"], 1)
+        mock_update_config.assert_called_once_with(conf)
+
+    def test_has_media(self):
+        message = MockMessage(
+            id=1,
+            media=True,
+            voice=MockVoice(
+                mime_type="audio/ogg",
+                date=datetime(2019, 7, 25, 14, 53, 50),
+            ),
         )
-        self.assertEqual(result, 1216)
+        self.assertEqual(_has_media(message, ["audio", "voice"]), True)
+        self.assertEqual(_has_media(message, ["audio", "video"]), False)
+
+        message_1 = MockMessage(id=2, media=None)
+        self.assertEqual(_has_media(message_1, ["audio", "voice"]), False)
 
     def test_can_download(self):
         file_formats = {
@@ -596,6 +814,10 @@ class MediaDownloaderTestCase(unittest.TestCase):
         result3 = _can_download("document", file_formats, "epub")
         self.assertEqual(result3, True)
 
+        file_formats = {"video": frozenset(["mp4", "all"])}
+        result4 = _can_download("video", file_formats, "mov")
+        self.assertEqual(result4, True)
+
     def test_is_exist(self):
         this_dir = os.path.dirname(os.path.abspath(__file__))
         result = _is_exist(os.path.join(this_dir, "__init__.py"))
@@ -607,10 +829,10 @@ class MediaDownloaderTestCase(unittest.TestCase):
         result2 = _is_exist(this_dir)
         self.assertEqual(result2, False)
 
-    @mock.patch("media_downloader.FAILED_IDS", [2, 3])
-    @mock.patch("media_downloader.yaml.safe_load")
+    @mock.patch("media_downloader.FAILED_IDS", {2, 3})
+    @mock.patch("media_downloader.yaml.load")
     @mock.patch("media_downloader.update_config", return_value=True)
-    @mock.patch("media_downloader.begin_import")
+    @mock.patch("media_downloader.run_import")
     @mock.patch("media_downloader.asyncio", new=MockAsync())
     def test_main(self, mock_import, mock_update, mock_yaml):
         conf = {
@@ -2,12 +2,15 @@
 import os
 import sys
 import tempfile
+import threading
+import time
 import unittest
 from pathlib import Path
 
 import mock
 
 sys.path.append("..")  # Adds higher directory to python modules path.
+from utils import file_management
 from utils.file_management import get_next_name, manage_duplicate_file
 
 
@@ -35,6 +38,106 @@ class FileManagementTestCase(unittest.TestCase):
         result1 = manage_duplicate_file(self.test_file_copy_1)
         self.assertEqual(result1, self.test_file_copy_1)
 
+    def test_manage_duplicate_file_same_size(self):
+        test_file_copy_3 = os.path.join(self.this_dir, "file-test-copy3.txt")
+        try:
+            with open(test_file_copy_3, "w") as f:
+                f.write("dummy fill")
+            result = manage_duplicate_file(test_file_copy_3)
+            self.assertEqual(result, test_file_copy_3)
+
+            with open(test_file_copy_3, "w") as f:
+                f.write("dummy file")
+            result1 = manage_duplicate_file(test_file_copy_3)
+            self.assertEqual(result1, self.test_file)
+            self.assertFalse(os.path.exists(test_file_copy_3))
+        finally:
+            if os.path.exists(test_file_copy_3):
+                os.remove(test_file_copy_3)
+
+    def test_manage_duplicate_file_vanished_candidate(self):
+        test_file_copy_3 = os.path.join(self.this_dir, "file-test-copy3.txt")
+        with open(test_file_copy_3, "w") as f:
+            f.write("dummy file")
+        real_file_md5 = file_management._file_md5
+
+        def removed_file_md5(path):
+            if path == self.test_file:
+                raise FileNotFoundError(path)
+            return real_file_md5(path)
+
+        try:
+            with mock.patch(
+                "utils.file_management._file_md5", side_effect=removed_file_md5
+            ):
+                result = manage_duplicate_file(test_file_copy_3)
+            self.assertEqual(result, test_file_copy_3)
+        finally:
+            os.remove(test_file_copy_3)
+
+    def test_manage_duplicate_file_concurrent(self):
+        test_file_copy_3 = os.path.join(self.this_dir, "file-test-copy3.txt")
+        test_file_copy_4 = os.path.join(self.this_dir, "file-test-copy4.txt")
+        for path in (test_file_copy_3, test_file_copy_4):
+            with open(path, "w") as f:
+                f.write("dummy fill")
+        real_file_md5 = file_management._file_md5
+
+        def slow_file_md5(path):
+            # Widen the window between hashing and removing the files.
+            file_md5 = real_file_md5(path)
+            time.sleep(0.1)
+            return file_md5
+
+        barrier = threading.Barrier(2)
+        results = {}
+
+        def dedup(path):
+            barrier.wait()
+            results[path] = manage_duplicate_file(path)
+
+        threads = [
+            threading.Thread(target=dedup, args=(path,))
+            for path in (test_file_copy_3, test_file_copy_4)
+        ]
+        try:
+            with mock.patch(
+                "utils.file_management._file_md5", side_effect=slow_file_md5
+            ):
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            remaining = [
+                path
+                for path in (test_file_copy_3, test_file_copy_4)
+                if os.path.exists(path)
+            ]
+            self.assertEqual(len(remaining), 1)
+            self.assertEqual(set(results.values()), set(remaining))
+        finally:
+            for path in (test_file_copy_3, test_file_copy_4):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def test_manage_duplicate_file_special_characters(self):
+        test_file = os.path.join(self.this_dir, "file-[test].txt")
+        test_file_copy_1 = os.path.join(self.this_dir, "file-[test]-copy1.txt")
+        for path in (test_file, test_file_copy_1):
+            with open(path, "w") as f:
+                f.write("dummy file")
+        os.mkdir(os.path.join(self.this_dir, "file-[test]-dir"))
+        try:
+            result = manage_duplicate_file(test_file_copy_1)
+            self.assertEqual(result, test_file)
+            self.assertFalse(os.path.exists(test_file_copy_1))
+        finally:
+            os.remove(test_file)
+            os.rmdir(os.path.join(self.this_dir, "file-[test]-dir"))
+
     def tearDown(self):
         os.remove(self.test_file)
         os.remove(self.test_file_copy_1)
+        # `test_manage_duplicate_file` removes it as a duplicate.
+        if os.path.exists(self.test_file_copy_2):
+            os.remove(self.test_file_copy_2)
@@ -28,3 +28,7 @@ class MetaTestCase(unittest.TestCase):
 
         result2 = LogFilter().filter(MockLog(funcName="Synced"))
         self.assertEqual(result2, True)
+
+        # Substrings of ignored function names are not filtered
+        result3 = LogFilter().filter(MockLog(funcName="voke"))
+        self.assertEqual(result3, True)
@@ -1,8 +1,37 @@
 """Utility functions to handle downloaded files."""
-import glob
 import os
 import pathlib
+import threading
 from hashlib import md5
+from typing import Optional
+
+# Downloads are deduplicated from executor threads. Two identical copies
+# checked at the same time would otherwise remove each other.
+_DEDUP_LOCK = threading.Lock()
+
+
+def _file_md5(file_path: str) -> str:
+    """
+    Compute the md5 hash of a file.
+
+    The file is read in chunks so that large media files are
+    not loaded into memory at once.
+
+    Parameters
+    ----------
+    file_path: str
+        Absolute path of the file to be hashed.
+
+    Returns
+    -------
+    str
+        Hex digest of the md5 hash of the file.
+    """
+    file_hash = md5()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
 
 
 def get_next_name(file_path: str) -> str:
@@ -45,7 +74,9 @@ def manage_duplicate_file(file_path: str):
     Check if a file is duplicate.
 
     Compare the md5 of files with copy name pattern
-    and remove if the md5 hash is same.
+    and remove if the md5 hash is same. Only files of the
+    same size are hashed. Concurrent calls are serialised so
+    that duplicates are removed one at a time.
 
     Parameters
     ----------
@@ -58,21 +89,32 @@ def manage_duplicate_file(file_path: str):
     str
         Absolute path of the duplicate managed file.
     """
-    # pylint: disable = R1732
-    posix_path = pathlib.Path(file_path)
-    file_base_name: str = "".join(posix_path.stem.split("-copy")[0])
-    name_pattern: str = f"{posix_path.parent}/{file_base_name}*"
-    # Reason for using `str.translate()`
-    # https://stackoverflow.com/q/22055500/6730439
-    old_files: list = glob.glob(
-        name_pattern.translate({ord("["): "[[]", ord("]"): "[]]"})
-    )
-    if file_path in old_files:
-        old_files.remove(file_path)
-    current_file_md5: str = md5(open(file_path, "rb").read()).hexdigest()
-    for old_file_path in old_files:
-        old_file_md5: str = md5(open(old_file_path, "rb").read()).hexdigest()
-        if current_file_md5 == old_file_md5:
-            os.remove(file_path)
-            return old_file_path
-    return file_path
+    with _DEDUP_LOCK:
+        posix_path = pathlib.Path(file_path)
+        file_base_name: str = "".join(posix_path.stem.split("-copy")[0])
+        current_file_size: int = os.path.getsize(file_path)
+        current_file_md5: Optional[str] = None
+        # `os.scandir` entries know their file type without a stat call and
+        # cache their stat result, so every candidate is stat'd at most once.
+        with os.scandir(posix_path.parent) as entries:
+            for entry in entries:
+                if (
+                    entry.name == posix_path.name
+                    or not entry.name.startswith(file_base_name)
+                    or not entry.is_file()
+                ):
+                    continue
+                try:
+                    # Files of different sizes cannot be duplicates, skip hashing them.
+                    if entry.stat().st_size != current_file_size:
+                        continue
+                    if current_file_md5 is None:
+                        current_file_md5 = _file_md5(file_path)
+                    old_file_md5: str = _file_md5(entry.path)
+                except FileNotFoundError:
+                    # Removed meanwhile as duplicate by a concurrent download.
+                    continue
+                if current_file_md5 == old_file_md5 and os.path.isfile(entry.path):
+                    os.remove(file_path)
+                    return entry.path
+        return file_path
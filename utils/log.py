@@ -1,5 +1,6 @@
 """Util module to handle logs."""
 import logging
+from typing import FrozenSet
 
 
 class LogFilter(logging.Filter):
@@ -9,8 +10,8 @@ class LogFilter(logging.Filter):
     Ignore logs from specific functions.
     """
 
+    ignored_functions: FrozenSet[str] = frozenset(("invoke",))
+
     # pylint: disable = W0221
     def filter(self, record):
-        if record.funcName in ("invoke"):
-            return False
-        return True
+        return record.funcName not in self.ignored_functions